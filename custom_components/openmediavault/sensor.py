@@ -1,17 +1,25 @@
 """The openmediavault sensor integration."""
+import asyncio
 import logging
+from collections import namedtuple
 from datetime import timedelta
 
+import aiohttp
 import voluptuous as vol
-import json
-import requests
+
+try:
+    import orjson
+except ImportError:
+    import json as orjson
 
 import homeassistant.helpers.config_validation as cv
 from homeassistant.components.sensor import PLATFORM_SCHEMA
 from homeassistant.const import (
     CONF_NAME, CONF_USERNAME, CONF_PASSWORD, CONF_HOST, CONF_MONITORED_CONDITIONS, STATE_UNKNOWN)
-from homeassistant.helpers.entity import Entity
-from homeassistant.util import Throttle
+from homeassistant.core import callback
+from homeassistant.helpers.aiohttp_client import async_create_clientsession
+from homeassistant.helpers.update_coordinator import (
+    CoordinatorEntity, DataUpdateCoordinator, UpdateFailed)
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -19,7 +27,10 @@ _LOGGER = logging.getLogger(__name__)
 DOMAIN = "openmediavault"
 DEFAULT_USERNAME = 'admin'
 ENDPOINT = '/rpc.php'
-MIN_TIME_BETWEEN_UPDATES = timedelta(seconds=30)
+UPDATE_INTERVAL = timedelta(seconds=30)
+MAX_UPDATE_INTERVAL = timedelta(minutes=5)
+REQUEST_HEADERS = {'Content-Type': 'application/json; charset=utf-8'}
+REQUEST_TIMEOUT = aiohttp.ClientTimeout(total=10, connect=3)
 ERROR_CODE_NOT_AUTHENTICATED = 5000
 ERROR_CODE_SESSION_EXPIRED = 5001
 
@@ -33,45 +44,37 @@ ATTR_LOAD_AVERAGE = 'loadaverage'
 ATTR_CPU_USAGE = 'cpuusage'
 ATTR_MEMORY_USAGE = 'memused'
 
+ConditionInfo = namedtuple('ConditionInfo', 'omv_name icon')
+
+# Keys returned by System.getInformation, mapped to the attribute they fill.
+RESPONSE_KEY_MAP = {
+    'hostname': ATTR_HOSTNAME,
+    'version': ATTR_VERSION,
+    'cpuModelName': ATTR_PROCESSOR,
+    'kernel': ATTR_KERNEL,
+    'time': ATTR_SYSTEM_TIME,
+    'uptime': ATTR_UPTIME,
+    'loadAverage': ATTR_LOAD_AVERAGE,
+    'cpuUsage': ATTR_CPU_USAGE,
+    'memUsed': ATTR_MEMORY_USAGE
+}
+
 MONITORED_CONDITIONS = {
-    ATTR_HOSTNAME: [
-        'Hostname',
-        'mdi:web'
-    ],
-    ATTR_VERSION: [
-        'Version',
-        'mdi:web'
-    ],
-    ATTR_PROCESSOR: [
-        'Processor',
-        'mdi:web'
-    ],
-    ATTR_KERNEL: [
-        'Kernel',
-        'mdi:web'
-    ],
-    ATTR_SYSTEM_TIME: [
-        'System time',
-        'mdi:web'
-    ],
-    ATTR_UPTIME: [
-        'Uptime',
-        'mdi:web'
-    ],
-    ATTR_LOAD_AVERAGE: [
-        'Load average',
-        'mdi:web'
-    ],
-    ATTR_CPU_USAGE: [
-        'CPU usage',
-        'mdi:web'
-    ],
-    ATTR_MEMORY_USAGE: [
-        'Memory usage',
-        'mdi:web'
-    ]
+    ATTR_HOSTNAME: ConditionInfo('Hostname', 'mdi:web'),
+    ATTR_VERSION: ConditionInfo('Version', 'mdi:web'),
+    ATTR_PROCESSOR: ConditionInfo('Processor', 'mdi:web'),
+    ATTR_KERNEL: ConditionInfo('Kernel', 'mdi:web'),
+    ATTR_SYSTEM_TIME: ConditionInfo('System time', 'mdi:web'),
+    ATTR_UPTIME: ConditionInfo('Uptime', 'mdi:web'),
+    ATTR_LOAD_AVERAGE: ConditionInfo('Load average', 'mdi:web'),
+    ATTR_CPU_USAGE: ConditionInfo('CPU usage', 'mdi:web'),
+    ATTR_MEMORY_USAGE: ConditionInfo('Memory usage', 'mdi:web')
 }
 
+# Position of each condition in OpenMediaVaultAPI.data.
+ATTR_INDEX = {attr: index for index, attr in enumerate(MONITORED_CONDITIONS)}
+RESPONSE_INDEX = {key: ATTR_INDEX[attr] for key, attr in RESPONSE_KEY_MAP.items()}
+
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
     vol.Optional(CONF_NAME, default=DOMAIN): cv.string,
     vol.Required(CONF_HOST): cv.string,
@@ -91,164 +94,195 @@ async def async_setup_platform(hass, config, async_add_entities, discovery_info=
     password = config.get(CONF_PASSWORD)
     host = config.get(CONF_HOST)
     conditions = config.get(CONF_MONITORED_CONDITIONS)
-    session = requests.Session()
-    api = OpenMediaVaultAPI(host, session, username, password, conditions)
+    # openmediavault authenticates with a session cookie, so use a dedicated
+    # cookie jar that also accepts cookies from hosts given as an IP address.
+    # The session still shares Home Assistant's pooled keep-alive connector.
+    session = async_create_clientsession(hass, cookie_jar=aiohttp.CookieJar(unsafe=True))
+    api = OpenMediaVaultAPI(host, session, username, password)
+    await api.login()
+    coordinator = OmvCoordinator(hass, api)
+    await coordinator.async_refresh()
 
     dev = []
     for condition in conditions:
-        dev.append(OpenMediaVaultSensor(api, name, condition))
+        dev.append(OpenMediaVaultSensor(coordinator, name, host, condition))
+
+    async_add_entities(dev)
 
-    async_add_entities(dev, True)
 
+class OmvCoordinator(DataUpdateCoordinator):
+    """Fetch data from openmediavault once per interval for all sensors."""
 
-class OpenMediaVaultSensor(Entity):
+    def __init__(self, hass, api):
+        """Initialize the coordinator."""
+        super().__init__(hass, _LOGGER, name=DOMAIN, update_interval=UPDATE_INTERVAL)
+        self.api = api
+
+    async def _async_update_data(self):
+        """Fetch the latest system information from openmediavault."""
+        await self.api.update()
+        if not self.api.available:
+            # Back off while the server is unreachable instead of polling it every interval.
+            self.update_interval = min(self.update_interval * 2, MAX_UPDATE_INTERVAL)
+            raise UpdateFailed("Unable to fetch data from openmediavault")
+        self.update_interval = UPDATE_INTERVAL
+        return self.api.data
+
+
+class OpenMediaVaultSensor(CoordinatorEntity):
     """Representation of a Sensor."""
 
-    def __init__(self, api, name, condition):
-        """Initialize the sensor."""
-        variable_info = MONITORED_CONDITIONS[condition]
+    # Home Assistant's Entity base classes keep a __dict__, so only the
+    # sensor's own fields live in slots.
+    __slots__ = ('_var_index', '_var_omv_name')
 
-        self._var_name = condition
-        self._var_omv_name = variable_info[0]
-        self._var_icon = variable_info[1]
-        self._api = api
-        self._name = name
-        self._state = None
+    def __init__(self, coordinator, name, host, condition):
+        """Initialize the sensor."""
+        super().__init__(coordinator)
+        info = MONITORED_CONDITIONS[condition]
 
-    @property
-    def name(self):
-        """Return the name of the sensor."""
-        return '{}_{}'.format(self._name, self._var_name)
+        self._var_index = ATTR_INDEX[condition]
+        self._var_omv_name = info.omv_name
+        self._attr_name = f'{name}_{condition}'
+        self._attr_icon = info.icon
+        self._attr_unique_id = f'{host}_{condition}'
+        self._attr_available = coordinator.last_update_success
 
     @property
     def state_attributes(self):
         """Return the attributes of the sensor."""
         return {'friendly_name': self._var_omv_name}
 
-    @property
-    def icon(self):
-        """Icon to use in the frontend, if any."""
-        return self._var_icon
-
     @property
     def state(self):
         """Return the state of the sensor."""
-        return self._state
+        return self.coordinator.data[self._var_index]
 
     @property
     def available(self):
-        """Return availability of OMV API."""
-        return self._api.available
+        """Return availability as of the last coordinator update."""
+        return self._attr_available
 
-    async def async_update(self):
-        """Fetch new state data for the sensor."""
-        self._api.update()
-        if self.available:
-            self._state = self._api.data[self._var_name]
-        else:
-            self._state = None
+    @callback
+    def _handle_coordinator_update(self):
+        """Cache the coordinator's availability, then write the new state."""
+        self._attr_available = self.coordinator.last_update_success
+        super()._handle_coordinator_update()
 
 
 class OpenMediaVaultAPI:
     """Get the latest data and update the states."""
 
-    def __init__(self, host, session, username, password, conditions):
+    def __init__(self, host, session, username, password):
         """Initialize the data object."""
         self.resource = "{}{}".format(host, ENDPOINT)
 
-        self.data = {
-            ATTR_HOSTNAME: STATE_UNKNOWN,
-            ATTR_VERSION: STATE_UNKNOWN,
-            ATTR_PROCESSOR: STATE_UNKNOWN,
-            ATTR_KERNEL: STATE_UNKNOWN,
-            ATTR_SYSTEM_TIME: STATE_UNKNOWN,
-            ATTR_UPTIME: STATE_UNKNOWN,
-            ATTR_LOAD_AVERAGE: STATE_UNKNOWN,
-            ATTR_CPU_USAGE: STATE_UNKNOWN,
-            ATTR_MEMORY_USAGE: STATE_UNKNOWN
-        }
+        self.data = [STATE_UNKNOWN] * len(ATTR_INDEX)
 
         self.username = username
         self.password = password
         self.raw_data = None
-        self.conditions = conditions
+        self._last_content = None
         self.available = True
         self.session = session
-        self.login()
-
-    def login(self):
+        self._lock = asyncio.Lock()
+
+        # Credentials are fixed for the lifetime of the API, so both request
+        # bodies are serialized once and reused on every poll.
+        self._login_body = orjson.dumps({
+            'service': 'session',
+            'method': 'login',
+            'params': {
+                'username': self.username,
+                'password': self.password
+            }
+        })
+        self._getinfo_body = orjson.dumps({
+            'service': 'System',
+            'method': 'getInformation',
+            'params': {},
+            'options': {
+                'updatelastaccess': False
+            }
+        })
+
+    async def _rpc_raw(self, body):
+        """Post a serialized RPC request to openmediavault and return the raw reply."""
+
+        async with self.session.post(self.resource, data=body,
+                                     headers=REQUEST_HEADERS, timeout=REQUEST_TIMEOUT) as response:
+            return await response.read()
+
+    async def _rpc(self, body):
+        """Post a serialized RPC request to openmediavault and return the decoded reply."""
+
+        return orjson.loads(await self._rpc_raw(body))
+
+    async def login(self):
         """Responsible for handling the login to openmediavault."""
 
         try:
-            response = self.session.post(self.resource, data=json.dumps({
-                'service': 'session',
-                'method': 'login',
-                'params': {
-                    'username': self.username,
-                    'password': self.password
-                }
-            }))
-
-            self.raw_data = response.json()
-
+            self.raw_data = await self._rpc(self._login_body)
             _LOGGER.debug("Response from openmediavault login: %s", self.raw_data)
             if self.raw_data['error'] is not None:
-                _LOGGER.error("Unable to login to openmediavault")
-                _LOGGER.error(self.raw_data['error']['message'])
+                _LOGGER.error("Unable to login to openmediavault: %s", self.raw_data['error']['message'])
 
-        except requests.exceptions.ConnectionError as e:
-            _LOGGER.error("Unable to login to openmediavault")
-            _LOGGER.error(e)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            _LOGGER.error("Unable to login to openmediavault: %s", e)
 
-    def get_system_information(self):
+    async def get_system_information(self):
         """Get the latest data from OMV server."""
 
-        try:
-            response = self.session.post(self.resource, data=json.dumps({
-                'service': 'System',
-                'method': 'getInformation',
-                'params': {},
-                'options': {
-                    'updatelastaccess': False
-                }
-            }))
-
-            self.raw_data = response.json()
-            _LOGGER.debug("Response from OMV get_system_information():  %s", self.raw_data)
-
-            error_check = self.error_check(self.raw_data)
-
-        except requests.exceptions.ConnectionError:
-            _LOGGER.warning("Unable to fetch data from openmediavault")
-            self.available = False
-            self.raw_data = None
-
-        if error_check['retry']:
-            self.get_system_information()
-        else:
-            self.format_system_information()
-            self.available = True
+        # A second attempt is only made after error_check has signed back in.
+        for _ in range(2):
+            try:
+                content = await self._rpc_raw(self._getinfo_body)
+                if content == self._last_content:
+                    # Nothing changed since the last successful poll.
+                    self.available = True
+                    return
+                self.raw_data = orjson.loads(content)
+                _LOGGER.debug("Response from OMV get_system_information(): %s", self.raw_data)
+
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                _LOGGER.warning("Unable to fetch data from openmediavault")
+                self.raw_data = None
+                break
+
+            error_check = await self.error_check(self.raw_data)
+            if not error_check['retry']:
+                self.format_system_information()
+                self._last_content = content
+                self.available = True
+                return
+
+        self.available = False
 
     def format_system_information(self):
-        """Format raw data into easily accessible dictionary"""
+        """Format raw data into the index-addressed data list"""
 
         if self.raw_data is not None and self.raw_data['response'] is not None:
             response = self.raw_data['response']
-            for attr_key in response:
-                prop = attr_key.lower().replace(" ", "_")
-                if isinstance(response[attr_key], dict):
+            for attr_key, value in response.items():
+                index = RESPONSE_INDEX.get(attr_key)
+                if index is None:
+                    index = ATTR_INDEX.get(attr_key.lower().replace(" ", "_"))
+                    if index is None:
+                        continue
+                if type(value) is dict:
                     # Unlikely that a dictionary will be returned, may not work as expected
-                    self.data[prop] = response[attr_key]['value']
+                    self.data[index] = value['value']
                 else:
-                    self.data[prop] = response[attr_key]
+                    self.data[index] = value
 
-    @Throttle(MIN_TIME_BETWEEN_UPDATES)
-    def update(self):
-        """Fetch new state data for the sensor."""
+    async def update(self):
+        """Fetch new data from the OMV server."""
 
-        self.get_system_information()
+        # Only one refresh may run at a time.
+        async with self._lock:
+            await self.get_system_information()
 
-    def error_check(self, response):
+    async def error_check(self, response):
         """Parse the response and check for any known errors."""
 
         retry = False
@@ -258,7 +292,7 @@ class OpenMediaVaultAPI:
 
             if error_code == ERROR_CODE_NOT_AUTHENTICATED or error_code == ERROR_CODE_SESSION_EXPIRED:
                 _LOGGER.debug("Session expired. Signing back in.")
-                self.login()
+                await self.login()
                 retry = True
 
         return {'retry': retry}
\ No newline at end of file